@@ -1 +1 @@
-__all__ = [dynamicargparser.py]
+__all__ = ['dynamicargparse']
@@ -6,6 +6,13 @@ Created on Nov 13, 2020
 import yaml
 import sys
 import itertools
+import argparse
+import contextlib
+import json
+import os
+import time
+import tracemalloc
+import weakref
         
 def bool_converter(s):
     if isinstance(s, str):
@@ -23,6 +30,23 @@ def bool_converter(s):
     else:
         raise ValueError
 
+#Type tags of the python types (or converters) which a static parser may declare via 'type='
+declared_types = {
+    int : 'int',
+    float : 'float',
+    bool : 'bool',
+    bool_converter : 'bool',
+    str : 'str'
+}
+
+#Read arguments from a file object, one argument per line as in argparse. Empty lines are skipped
+#Lines are read one by one through the file buffer, so the file is never loaded as a whole
+def iter_file_arguments(f):
+    for line in f:
+        line = line.rstrip('\n')
+        if line:
+            yield line
+
 #Check a type consistency b/w two types, typ1 and typ2
 #If their types disagree but one type can cover the other, then return the more general type among them.
 #If their types are contradictory, then raise exception
@@ -59,6 +83,73 @@ def type_consistency(typ1, typ2):
         return 'list_' + unified_terminal_typ
     return unified_terminal_typ
         
+class ParseTracer():
+    #Collect per-stage statistics of 'DynamicArgumentParser.parse_argument'. Each parse starts a new trace
+    #Each stage record has 'stage', 'wall_time' (sec), 'num_args' (the number of parsed arguments after the stage)
+    #and 'peak_memory' (bytes, only if trace_memory is True and tracemalloc is not already tracing by the caller)
+    #Counters: 'config_bytes' (bytes read from configuration files), 'type_conflicts' (resolved type disagreements)
+    def __init__(self, callback = None, trace_memory = False):
+        # - callback : Called with the record of a stage whenever the stage finishes
+        # - trace_memory : Record the peak allocation of each stage with tracemalloc. If the caller is already tracing,
+        #   nothing is recorded so that the peak measured by the caller is kept
+        super(ParseTracer, self).__init__()
+        
+        self.callback = callback
+        self.trace_memory = trace_memory
+        self.reset()
+    
+    def reset(self):
+        self.stages = []
+        self.counters = {}
+    
+    def count(self, name, n = 1):
+        self.counters[name] = self.counters.get(name, 0) + n
+    
+    @contextlib.contextmanager
+    def stage(self, name, parser = None):
+        record = {'stage': name}
+        
+        started_tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+            base_memory = tracemalloc.get_traced_memory()[0]
+        
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['wall_time'] = time.perf_counter() - start
+            if parser is not None:
+                record['num_args'] = len(parser.arg_dict)
+            if started_tracing:
+                record['peak_memory'] = max(0, tracemalloc.get_traced_memory()[1] - base_memory)
+                tracemalloc.stop()
+            
+            self.stages.append(record)
+            if self.callback is not None:
+                self.callback(record)
+    
+    def todict(self):
+        return {
+            'stages' : [dict(record) for record in self.stages],
+            'counters' : dict(self.counters),
+            'wall_time' : sum(record['wall_time'] for record in self.stages)
+        }
+    
+    def tojson(self):
+        #A single line, which can be appended to job logs as it is
+        return json.dumps(self.todict(), sort_keys=True)
+
+class NullStage():
+    #Used in place of 'ParseTracer.stage' when tracing is disabled
+    def __enter__(self):
+        return None
+    
+    def __exit__(self, *exc_info):
+        return False
+
+null_stage = NullStage()
+
 class DynamicArgumentParser():
     converters = {
         'list_int' : int,
@@ -106,26 +197,116 @@ class DynamicArgumentParser():
         else:
             raise Exception("Can not handle the conversion of the type {}".format(type(v)))
 
-    def __init__(self, staticparser = None, check_type_consistency = True):
+    @classmethod
+    def _coerce(cls, v, typ, declared = True, wrap_scalar = True):
+        #Convert v into the declared type 'typ' without running the type inference of '_convert'
+        #Return None if v does not fit in the declared type. The caller falls back to the inference then
+        # - declared : False for the implicit 'str' of argparse. Only strings are converted then
+        # - wrap_scalar : Put a scalar into a list for a list type. False for values already produced by argparse
+        terminal_typ = typ.replace('list_', '') if typ.startswith('list') else typ
+        
+        if typ.startswith('list'):
+            if not isinstance(v, list) and not wrap_scalar:
+                return None
+            elements = v if isinstance(v, list) else [v]
+        elif isinstance(v, list):
+            return None
+        else:
+            elements = [v]
+        
+        result_list = []
+        for e in elements:
+            if not declared and not isinstance(e, str):
+                return None
+            if isinstance(e, str):
+                try:
+                    e = cls.converters[terminal_typ](e)
+                except ValueError:
+                    return None
+            elif terminal_typ == 'str' and isinstance(e, (bool, int, float)):
+                e = str(e)
+            elif terminal_typ == 'float' and isinstance(e, int) and not isinstance(e, bool):
+                e = float(e)
+            elif declared_types.get(type(e)) != terminal_typ:
+                return None
+            result_list.append(e)
+        
+        if typ.startswith('list'):
+            return result_list, typ
+        return result_list[0], typ
+
+    def __init__(self, staticparser = None, check_type_consistency = True, fromfile_prefix_chars = None, tracer = None):
         # - check_type_consistency : Check whether a data type is matched for the same argument
+        # - fromfile_prefix_chars : An argument starting with one of these characters (e.g. '@') is replaced by the arguments read from the file
+        #   which follows the prefix, one argument per line. '@-' reads the arguments from the standard input. Disabled if None
+        # - tracer : ParseTracer which records statistics of each parsing stage. Tracing costs nothing if None
         super(DynamicArgumentParser, self).__init__()
         
         self.staticparser = staticparser
+        self.fromfile_prefix_chars = fromfile_prefix_chars
+        self.tracer = tracer
         self.arg_dict = {} # Key: arg name, Value: (arg value #converted python data, arg type #string, terminal type)
         self.check_type_consistency = check_type_consistency
+        self._schema = None # Key: arg name, Value: (arg type declared by the static parser, False if the type is the implicit 'str')
+    
+    def get_schema(self, refresh = False):
+        # Read the argument types declared in the static parser and cache them
+        # - refresh : Read the static parser again. Use it after adding arguments to the static parser
+        if self._schema is not None and not refresh:
+            return self._schema
+        
+        schema = {}
+        if self.staticparser is not None:
+            for action in self.staticparser._actions:
+                if isinstance(action, (argparse._HelpAction, argparse._VersionAction, argparse._SubParsersAction)):
+                    continue
+                
+                declared = True
+                if isinstance(action, argparse._CountAction):
+                    typ = 'int'
+                elif action.nargs == 0:
+                    #store_const, store_true and store_false. The value is either 'const' or 'default'
+                    const_typ = declared_types.get(type(action.const))
+                    default_typ = declared_types.get(type(action.default), const_typ) if action.default is not None else const_typ
+                    typ = const_typ if const_typ == default_typ else None
+                elif action.type is None:
+                    #argparse leaves a command-line value as a string if 'type' is not declared, but not a default value
+                    typ, declared = 'str', False
+                else:
+                    typ = declared_types.get(action.type)
+                
+                if typ is None:
+                    #Unknown type. The type inference takes care of this argument
+                    continue
+                
+                if isinstance(action, argparse._AppendAction) or action.nargs in ('*', '+', argparse.REMAINDER) \
+                        or (isinstance(action.nargs, int) and action.nargs > 0):
+                    typ = 'list_' + typ
+                
+                schema[action.dest] = (typ, declared)
+        
+        self._schema = schema
+        return schema
     
     @classmethod
-    def dict_to_arg_dict(cls, dic, arg_dict = {}, prefix = []):
+    def dict_to_arg_dict(cls, dic, arg_dict = {}, prefix = [], schema = None, wrap_scalar = True):
+        # - schema : Arguments declared in the schema are converted into the declared type without type inference
+        # - wrap_scalar : Put a scalar into a list if the schema declares a list type
         for k, v in dic.items():
             if v is None:
                 continue
             if isinstance(v, dict):
                 argname = '.'.join(prefix + [k])
                 arg_dict[argname] = ({}, 'dict')
-                cls.dict_to_arg_dict(v, arg_dict, prefix = prefix + [k])
+                cls.dict_to_arg_dict(v, arg_dict, prefix = prefix + [k], schema = schema, wrap_scalar = wrap_scalar)
             else:
                 argname = '.'.join(prefix + [k])
                 
+                coerced = cls._coerce(v, *schema[argname], wrap_scalar = wrap_scalar) if schema and argname in schema else None
+                if coerced is not None:
+                    arg_dict[argname] = coerced
+                    continue
+                
                 _v, typ = cls._convert(v)
                 
                 arg_dict[argname] = (v, typ)
@@ -133,6 +314,28 @@ class DynamicArgumentParser():
         return arg_dict
     
     
+    def _stage(self, name):
+        if self.tracer is None:
+            return null_stage
+        return self.tracer.stage(name, self)
+    
+    def _expand_arg_files(self, args):
+        if not self.fromfile_prefix_chars:
+            return args
+        return self._iter_expanded_args(args)
+    
+    def _iter_expanded_args(self, args):
+        #Lazily replace '@file' arguments with the arguments in the file. Files can refer to other files
+        for arg in args:
+            if len(arg) > 1 and arg[0] in self.fromfile_prefix_chars:
+                if arg[1:] == '-':
+                    yield from self._iter_expanded_args(iter_file_arguments(sys.stdin))
+                else:
+                    with open(arg[1:], 'r') as f:
+                        yield from self._iter_expanded_args(iter_file_arguments(f))
+            else:
+                yield arg
+    
     def update(self, add_dict, overwrite = True):
         # - overwrite:
         # If true, self.arg_dict has a priority over add_dict when a duplicate key occurs
@@ -150,6 +353,8 @@ class DynamicArgumentParser():
                     typ2 = v[1]
                     try:
                         typ = type_consistency(typ1, typ2)
+                        if typ1 != typ2 and self.tracer is not None:
+                            self.tracer.count('type_conflicts')
                     except KeyError:
                         #it happens when one type is 'dict' and the other type is 'dictionary'
                         msg = "Type Consistency check Error\n"\
@@ -183,13 +388,16 @@ class DynamicArgumentParser():
             
         with open(file, 'r') as f:
             cfg = yaml.load(f, Loader=yaml.FullLoader)
+            if self.tracer is not None:
+                self.tracer.count('config_bytes', os.fstat(f.fileno()).st_size)
         
-        arg_dict = DynamicArgumentParser.dict_to_arg_dict(cfg, arg_dict = {})
+        arg_dict = DynamicArgumentParser.dict_to_arg_dict(cfg, arg_dict = {}, schema = self.get_schema())
         
         self.update(arg_dict, add_mode == 'o')
         
     
-    def static_parse_cmd_args(self, args = None, add_mode = ['o', 'a', 'n'][0]):
+    def static_parse_cmd_args(self, args = None, add_mode = ['o', 'a', 'n'][0], expand_arg_files = True):
+        # - expand_arg_files : Replace '@file' arguments. False if they are already replaced
         if add_mode == 'n':
             self.arg_dict = {}
         
@@ -197,53 +405,68 @@ class DynamicArgumentParser():
             args = sys.argv[1:]
         
         if self.staticparser is not None:
+            if expand_arg_files:
+                args = list(self._expand_arg_files(args))
             static_args, args = self.staticparser.parse_known_args(args)
-            arg_dict = DynamicArgumentParser.dict_to_arg_dict(static_args.__dict__, arg_dict = {})
+            #argparse already shaped the values. A scalar default of a list argument stays a scalar
+            arg_dict = DynamicArgumentParser.dict_to_arg_dict(static_args.__dict__, arg_dict = {}, schema = self.get_schema(), wrap_scalar = False)
             self.update(arg_dict, add_mode == 'o')
         
         return args
             
     
-    def dynamic_parse_cmd_args(self, args = None, add_mode = ['o', 'a', 'n'][0]):
+    def dynamic_parse_cmd_args(self, args = None, add_mode = ['o', 'a', 'n'][0], expand_arg_files = True):
+        # - expand_arg_files : Replace '@file' arguments. False if they are already replaced
         if add_mode == 'n':
             self.arg_dict = {}
         
         if args is None:
             args = sys.argv[1:]
         
+        schema = self.get_schema()
         arg_dict = {}
         argvalue = []
         argname = None
-        for arg in args + ["-"]: #Append a dummy argument to keep the logic simple
-            if arg.startswith(("-", "--")):
-                if argname is not None:
-                    v = None
-                    typ = None
-                    if len(argvalue) == 0:
-                        v, typ = True, 'bool'
-                    elif len(argvalue) == 1:
-                        v, typ = self._convert(argvalue[0])
-                    elif len(argvalue) > 1:
-                        v, typ = self._convert(argvalue)
+        expanded_args = self._expand_arg_files(args) if expand_arg_files else args
+        try:
+            for arg in itertools.chain(expanded_args, ["-"]): #Append a dummy argument to keep the logic simple
+                if arg.startswith(("-", "--")):
+                    if argname is not None:
+                        v = None
+                        typ = None
+                        coerced = self._coerce(argvalue[0] if len(argvalue) == 1 else argvalue, *schema[argname]) \
+                                    if len(argvalue) > 0 and argname in schema else None
+                        if len(argvalue) == 0:
+                            v, typ = True, 'bool'
+                        elif coerced is not None:
+                            v, typ = coerced
+                        elif len(argvalue) == 1:
+                            v, typ = self._convert(argvalue[0])
+                        elif len(argvalue) > 1:
+                            v, typ = self._convert(argvalue)
                         
-                    lastindex = 0
-                    while True:
-                        lastindex = argname.find('.', lastindex)
-                        if lastindex == -1:
-                            break
-                        arg_dict[ argname[:lastindex] ] = ({}, 'dict')
-                        lastindex = lastindex + 1
+                        lastindex = 0
+                        while True:
+                            lastindex = argname.find('.', lastindex)
+                            if lastindex == -1:
+                                break
+                            arg_dict[ argname[:lastindex] ] = ({}, 'dict')
+                            lastindex = lastindex + 1
 
-                    arg_dict[argname] = (v, typ)
+                        arg_dict[argname] = (v, typ)
                     
-                argname = arg.lstrip('-')
-                argvalue = []
-                assign_symbol = argname.find('=')
-                if assign_symbol != -1:
-                    argname, argvalue = argname[:assign_symbol], argname[assign_symbol+1:]
-                    argvalue = [x for x in argvalue.split(',') if len(x) > 0]
-            else:
-                argvalue.append(arg)
+                    argname = arg.lstrip('-')
+                    argvalue = []
+                    assign_symbol = argname.find('=')
+                    if assign_symbol != -1:
+                        argname, argvalue = argname[:assign_symbol], argname[assign_symbol+1:]
+                        argvalue = [x for x in argvalue.split(',') if len(x) > 0]
+                else:
+                    argvalue.append(arg)
+        finally:
+            #Close the argument files even if parsing stops in the middle
+            if expanded_args is not args:
+                expanded_args.close()
         
         self.update(arg_dict, add_mode == 'o')
 
@@ -251,17 +474,32 @@ class DynamicArgumentParser():
         if args is None:
             args = sys.argv[1:]
         
-        #renew old parsing results and parse command line arguments with a static parser 
-        args_yet_to_be_parsed = self.static_parse_cmd_args(args, add_mode = 'n')
+        #Replace '@file' arguments. Without a static parser, the dynamic parser consumes them lazily while the files are read
+        #A static parser reads the whole argument list at once (argparse makes a list of it)
+        expanded_args = self._expand_arg_files(args)
         
-        #handle arguments unrecognized by the static parser
-        self.dynamic_parse_cmd_args(args_yet_to_be_parsed, add_mode = 'a')
+        if self.tracer is not None:
+            self.tracer.reset()
+        
+        try:
+            #renew old parsing results and parse command line arguments with a static parser 
+            with self._stage('static'):
+                args_yet_to_be_parsed = self.static_parse_cmd_args(expanded_args, add_mode = 'n', expand_arg_files = False)
+            
+            #handle arguments unrecognized by the static parser
+            with self._stage('dynamic'):
+                self.dynamic_parse_cmd_args(args_yet_to_be_parsed, add_mode = 'a', expand_arg_files = False)
+        finally:
+            #Close the argument files even if parsing stops in the middle
+            if expanded_args is not args:
+                expanded_args.close()
         
         if cfgfile_arg != '' and cfgfile_arg in self.arg_dict:
             cfg_filepath = self.arg_dict.get(cfgfile_arg)[0]
             
             #Load arguments from the configuration file
-            self.parse_config_file(cfg_filepath, 'a') #'a' is No-Overwrite mode. CMD-line args has a priority
+            with self._stage('config'):
+                self.parse_config_file(cfg_filepath, 'a') #'a' is No-Overwrite mode. CMD-line args has a priority
        
         def convert_2_recursive_dict(arg_dict):
             root_dir = {}
@@ -280,32 +518,170 @@ class DynamicArgumentParser():
             
             return root_dir
         
-        rdict = convert_2_recursive_dict(self.arg_dict)
+        with self._stage('build_dict'):
+            rdict = convert_2_recursive_dict(self.arg_dict)
         
         #args_namespace = argdict_to_namespace(self.arg_dict)
         
-        args_tree = AugmentedNameSpace(rdict)
-        args_tree.activate(True)
+        with self._stage('namespace'):
+            args_tree = AugmentedNameSpace(rdict)
+            args_tree.activate(True)
         
         return args_tree#args_namespace
     
+class ChildDict(dict):
+    #Children dictionary of AugmentedNameSpace. Clones of a namespace share it, and it can be referenced weakly
+    __slots__ = ('__weakref__',)
+
 class AugmentedNameSpace():
-    MEMBER_ATTRIBUTE = {'_mem_parent', '_mem_children', '_mem_activate', '_mem_argument_dict', '_mem_absorbing_node', '_mem_key_chain_buffer'}
+    MEMBER_ATTRIBUTE = {'_mem_parent', '_mem_children', '_mem_activate', '_mem_argument_dict', '_mem_key_chain_buffer',
+                        '_mem_key', '_mem_tree', '_mem_args_shared', '_mem_children_shared', '_mem_exposed',
+                        '_mem_ref_overlay', '_mem_ref_forward', '_mem_origin'}
     
     def __init__(self, arg_dict, p = None, activate = False):
         super(AugmentedNameSpace, self).__init__()
         
         self._mem_parent = p
-        self._mem_children = {}
+        self._mem_children = ChildDict()
         
         self._mem_activate = activate
         self._mem_argument_dict = {} #key: arg name , value: {'value': value, 'ref_count': ref count}
          
-        self._mem_absorbing_node = NoneLike(self)
         self._mem_key_chain_buffer = []
         
+        #Copy-on-write state used by clone()
+        self._mem_key = None #The key of this node in its parent
+        self._mem_tree = p._mem_tree if p is not None else [False] #Shared by the nodes of a tree. True once a node of the tree has been shared
+        self._mem_args_shared = False #_mem_argument_dict may be referenced by another node
+        self._mem_children_shared = False #_mem_children may be referenced by another node
+        self._mem_exposed = None #Weak references to the other children dictionaries which may hold the children of this node
+        self._mem_ref_overlay = None #Ref counts kept apart from the shared _mem_argument_dict
+        self._mem_ref_forward = None #The node where ref counts are forwarded to
+        self._mem_origin = None #The node a snapshot is taken from
+        
         self._build(arg_dict)
     
+    def clone(self, forward_ref_count = False):
+        # Return a copy which shares unchanged sub-namespaces with this namespace. A sub-namespace is copied only when it is modified
+        # on either side, so changing a single value costs about the depth of the value rather than the size of the namespace
+        # Reading never copies. Values themselves are not copied. Assign a new value instead of modifying it in place (e.g. list.append)
+        # The clone counts references separately, starting from the counts at the time of cloning
+        # - forward_ref_count : If True, references made through the clone are counted in this namespace too
+        return self._fork(None, forward_ref_count)
+    
+    def __copy__(self):
+        return self.clone()
+    
+    def _fork(self, p, forward_ref_count):
+        #A new node sharing the dictionaries of this node. The children stay owned by this node until the new node forks them
+        node = AugmentedNameSpace.__new__(AugmentedNameSpace)
+        node._mem_parent = p
+        node._mem_children = self._mem_children
+        node._mem_activate = self._mem_activate if p is None else p._mem_activate
+        node._mem_argument_dict = self._mem_argument_dict
+        node._mem_key_chain_buffer = []
+        node._mem_key = self._mem_key
+        node._mem_tree = p._mem_tree if p is not None else [True]
+        node._mem_args_shared = True
+        node._mem_children_shared = True
+        node._mem_exposed = None
+        node._mem_ref_overlay = dict(self._mem_ref_overlay) if self._mem_ref_overlay else None
+        node._mem_ref_forward = (self._mem_origin or self) if forward_ref_count else None
+        node._mem_origin = None
+        
+        node._mem_tree[0] = True
+        self._mem_args_shared = True
+        self._mem_children_shared = True
+        self._mem_tree[0] = True
+        return node
+    
+    def _snapshot(self):
+        #A frozen copy of this node for the other namespaces, taken before this node changes
+        node = self._fork(None, False)
+        node._mem_origin = self._mem_origin or self
+        return node
+    
+    def _get_child(self, key):
+        #Children held in the dictionary but owned by another namespace are forked on the first access
+        child = self._mem_children[key]
+        if child._mem_parent is not self:
+            child = child._fork(self, self._mem_ref_forward is not None)
+            self._own_children()
+            self._mem_children[key] = child
+        return child
+    
+    def _own_children(self):
+        #Copy the children dictionary if it is shared. Both dictionaries may hold children owned by other nodes,
+        #so those owners have to put a snapshot in them before modifying the children
+        if not self._mem_children_shared:
+            return
+        
+        old = self._mem_children
+        self._mem_children = ChildDict(old)
+        self._mem_children_shared = False
+        
+        owners = {}
+        for c in old.values():
+            if c._mem_parent is not None:
+                owners[id(c._mem_parent)] = c._mem_parent
+        for owner in owners.values():
+            for children in (old, self._mem_children):
+                if owner._mem_children is not children:
+                    owner._expose(children)
+    
+    def _expose(self, children):
+        if self._mem_exposed is None:
+            self._mem_exposed = []
+        self._mem_exposed.append(weakref.ref(children))
+        self._mem_tree[0] = True
+    
+    def _own_arguments(self):
+        if not self._mem_args_shared:
+            return
+        
+        overlay = self._mem_ref_overlay or {}
+        self._mem_argument_dict = {k: {'value': v['value'], 'ref_count': overlay.get(k, v['ref_count'])} for k, v in self._mem_argument_dict.items()}
+        self._mem_ref_overlay = None
+        self._mem_args_shared = False
+    
+    def _preserve(self):
+        #This node is going to change. The other namespaces may reach it through the children dictionaries of its ancestors
+        if not self._mem_tree[0]:
+            #Nothing in this tree has ever been shared
+            return
+        
+        path = [self]
+        while path[-1]._mem_parent is not None:
+            path.append(path[-1]._mem_parent)
+        
+        for i in range(len(path) - 1, 0, -1):
+            path[i]._preserve_child(path[i - 1])
+    
+    def _preserve_child(self, child):
+        #Replace 'child' with its snapshot in the children dictionaries held by the other namespaces
+        if not self._mem_children_shared and not self._mem_exposed:
+            return
+        
+        self._own_children()
+        
+        snapshot = None
+        alive = []
+        for ref in self._mem_exposed:
+            children = ref()
+            if children is None:
+                continue
+            alive.append(ref)
+            if children.get(child._mem_key) is child:
+                if snapshot is None:
+                    snapshot = child._snapshot()
+                children[child._mem_key] = snapshot
+        self._mem_exposed = alive or None
+    
+    def _ref_count(self, key):
+        if self._mem_ref_overlay is not None and key in self._mem_ref_overlay:
+            return self._mem_ref_overlay[key]
+        return self._mem_argument_dict[key]['ref_count']
+    
     
     def keys(self):
         return itertools.chain(self._mem_argument_dict.keys(), self._mem_children)
@@ -331,7 +707,7 @@ class AugmentedNameSpace():
         for k,v in self._mem_argument_dict.items():
             arg_value = v['value']
             if include_ref_count:
-                root_dir[k] = (arg_value, v['ref_count']) 
+                root_dir[k] = (arg_value, self._ref_count(k)) 
             else:
                 root_dir[k] = arg_value
         
@@ -343,9 +719,15 @@ class AugmentedNameSpace():
     def activate(self, v = True):
         self._mem_activate = v
         for c in self._mem_children.values():
-            c.activate(v)
+            #Children owned by another namespace take the value of this node when they are forked
+            if c._mem_parent is self:
+                c.activate(v)
     
     def trim(self, min_ref_count = 1):
+        self._preserve()
+        self._own_arguments()
+        self._own_children()
+        
         del_keys = []
         for k,v in self._mem_argument_dict.items():
             if v['ref_count'] < min_ref_count:
@@ -355,8 +737,8 @@ class AugmentedNameSpace():
             del self._mem_argument_dict[k]
         
         del_keys = []
-        for k, c in self._mem_children.items():
-            if c.trim(min_ref_count) is None:
+        for k in list(self._mem_children):
+            if self._get_child(k).trim(min_ref_count) is None:
                 del_keys.append(k)
         
         for k in del_keys:
@@ -372,16 +754,20 @@ class AugmentedNameSpace():
             if isinstance(v, dict):
                 self._add_child(k, v)
             else:
-                setattr(self, k, v)
+                self._set_argument(k, v)
 #            setattr(self, k, v)   
     
     def _add_child(self, k, arg_dict):
-        self._mem_children[k] = AugmentedNameSpace(arg_dict, self, self._mem_activate)
+        self._preserve()
+        self._own_children()
+        child = AugmentedNameSpace(arg_dict, self, self._mem_activate)
+        child._mem_key = k
+        self._mem_children[k] = child
         
     def __repr__(self, as_str = True):
         root_dir = {}
         for k,v in self._mem_argument_dict.items():
-            root_dir[k] = '(value: {}, ref_count: {})'.format(v['value'], v['ref_count'])  #('value: ' + str(arg_value), 'ref_count: ' + str(v['ref_count'])) 
+            root_dir[k] = '(value: {}, ref_count: {})'.format(v['value'], self._ref_count(k))  #('value: ' + str(arg_value), 'ref_count: ' + str(v['ref_count'])) 
             
         for k,v in self._mem_children.items():
             root_dir[k] = v.__repr__(as_str = False)
@@ -427,6 +813,12 @@ class AugmentedNameSpace():
             return
             #raise Exception("It tries to assign a value by replacing AugmentedNode")
         
+        self._set_argument(key, value)
+    
+    def _set_argument(self, key, value):
+        self._preserve()
+        self._own_arguments()
+        
          #Handle argument assignment
         if key not in self._mem_argument_dict:
             self._mem_argument_dict[key] = {'value': value, 'ref_count': 0}
@@ -445,7 +837,7 @@ class AugmentedNameSpace():
             #Go through deeper level
             self._mem_key_chain_buffer.clear()
             self._mem_key_chain_buffer.append(key) 
-            return self._mem_children[key]
+            return self._get_child(key)
         elif key in self._mem_argument_dict:
             #The terminal value get return 
             self._stack_ref_count(key)
@@ -454,12 +846,28 @@ class AugmentedNameSpace():
             #The referenced key does not exist in the namespace. Move to the absorbing state
             self._clear_key_chain_buffer()
             self._append_key_chain_buffer(key)
-            return self._mem_absorbing_node
+            return NoneLike(self)
     
     def _stack_ref_count(self, key):
         additional_ref_count = 1 if self._mem_activate else 0
         
-        self._mem_argument_dict[key]['ref_count'] = self._mem_argument_dict[key]['ref_count'] + additional_ref_count 
+        self._add_ref_count(key, additional_ref_count)
+    
+    def _add_ref_count(self, key, n):
+        if n == 0:
+            return
+        
+        self._preserve()
+        if self._mem_args_shared:
+            #Count without copying the shared dictionary
+            if self._mem_ref_overlay is None:
+                self._mem_ref_overlay = {}
+            self._mem_ref_overlay[key] = self._ref_count(key) + n
+        else:
+            self._mem_argument_dict[key]['ref_count'] = self._mem_argument_dict[key]['ref_count'] + n
+        
+        if self._mem_ref_forward is not None and key in self._mem_ref_forward._mem_argument_dict:
+            self._mem_ref_forward._add_ref_count(key, n)
 
     def _clear_key_chain_buffer(self):
         self._mem_key_chain_buffer.clear()
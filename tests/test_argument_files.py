@@ -0,0 +1,82 @@
+import argparse
+import io
+
+import pytest
+
+import dynamicargparse
+from dynamicargparse import DynamicArgumentParser
+
+
+def write_args(path, args):
+    path.write_text('\n'.join(args) + '\n')
+    return str(path)
+
+
+def test_file_arguments_match_command_line(tmp_path):
+    inner = write_args(tmp_path / 'inner.txt', ['--e', '5e-3', '--f', 'a', 'b'])
+    outer = write_args(tmp_path / 'outer.txt', ['--b.c=2', '@' + inner, '', '--name', 'my run', '--d'])
+    
+    args = DynamicArgumentParser(fromfile_prefix_chars = '@').parse_argument(args = ['--a', '1', '@' + outer])
+    expected = DynamicArgumentParser().parse_argument(
+        args = ['--a', '1', '--b.c=2', '--e', '5e-3', '--f', 'a', 'b', '--name', 'my run', '--d'])
+    assert args.todict() == expected.todict()
+    assert args.name == 'my run'
+
+
+def test_file_arguments_with_static_parser(tmp_path):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--e', type=str)
+    path = write_args(tmp_path / 'args.txt', ['--e', '5e-3', '--x', '1'])
+    
+    args = DynamicArgumentParser(staticparser = parser, fromfile_prefix_chars = '@').parse_argument(args = ['@' + path])
+    assert args.todict() == {'e': '5e-3', 'x': 1}
+
+
+def test_stdin_arguments(monkeypatch):
+    monkeypatch.setattr('sys.stdin', io.StringIO('--s\n3\n--t\nx\n'))
+    args = DynamicArgumentParser(fromfile_prefix_chars = '@').parse_argument(args = ['@-'])
+    assert args.todict() == {'s': 3, 't': 'x'}
+
+
+def test_prefix_is_disabled_by_default():
+    args = DynamicArgumentParser().parse_argument(args = ['--email', '@home'])
+    assert args.email == '@home'
+
+
+def test_direct_dynamic_parse_expands_files(tmp_path):
+    path = write_args(tmp_path / 'args.txt', ['--a', '1', '--b=x,y'])
+    dynamicparser = DynamicArgumentParser(fromfile_prefix_chars = '@')
+    dynamicparser.dynamic_parse_cmd_args(['@' + path, '--c'], add_mode = 'n')
+    assert dynamicparser.arg_dict == {'a': (1, 'int'), 'b': (['x', 'y'], 'list_str'), 'c': (True, 'bool')}
+
+
+def test_direct_static_parse_expands_files(tmp_path):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--e', type=str)
+    path = write_args(tmp_path / 'args.txt', ['--e', '5', '--x', '1'])
+    dynamicparser = DynamicArgumentParser(staticparser = parser, fromfile_prefix_chars = '@')
+    assert dynamicparser.static_parse_cmd_args(['@' + path], add_mode = 'n') == ['--x', '1']
+    assert dynamicparser.arg_dict == {'e': ('5', 'str')}
+
+
+def test_file_is_closed_when_parsing_fails(tmp_path, monkeypatch):
+    path = write_args(tmp_path / 'args.txt', ['--a', '1', '--b', '2'])
+    opened = []
+    
+    def tracking_open(*args, **kwargs):
+        f = open(*args, **kwargs)
+        opened.append(f)
+        return f
+    
+    def failing_convert(v):
+        raise ValueError
+    
+    monkeypatch.setattr(dynamicargparse, 'open', tracking_open, raising = False)
+    dynamicparser = DynamicArgumentParser(fromfile_prefix_chars = '@')
+    monkeypatch.setattr(dynamicparser, '_convert', failing_convert)
+    
+    #The traceback keeps the parsing frames alive, so the files are not closed by garbage collection
+    with pytest.raises(ValueError) as excinfo:
+        dynamicparser.parse_argument(args = ['@' + path])
+    assert excinfo.traceback
+    assert opened and all(f.closed for f in opened)
@@ -0,0 +1,190 @@
+import copy
+
+from dynamicargparse import AugmentedNameSpace
+
+
+def make_args():
+    args = AugmentedNameSpace({'lr': 0.1, 'model': 'resnet18', 'optim': {'name': 'adam', 'betas': [0.9, 0.99], 'sched': {'step': 10}}})
+    args.activate(True)
+    return args
+
+
+def test_clone_is_independent_of_original():
+    args = make_args()
+    snapshot = args.todict(True)
+    cloned = args.clone()
+    cloned.lr = 0.5
+    cloned.optim.sched.step = 20
+    cloned.new.key = 1
+    
+    assert args.todict(True) == snapshot
+    assert cloned.todict() == {'lr': 0.5, 'model': 'resnet18', 'optim': {'name': 'adam', 'betas': [0.9, 0.99], 'sched': {'step': 20}}, 'new': {'key': 1}}
+
+
+def test_original_is_independent_of_clone():
+    args = make_args()
+    cloned = args.clone()
+    snapshot = cloned.todict(True)
+    args.lr = 0.5
+    args.optim.sched.step = 20
+    args.new.key = 1
+    
+    assert cloned.todict(True) == snapshot
+    assert args.optim.sched.step == 20
+
+
+def test_held_sub_namespace_stays_attached():
+    args = make_args()
+    optim = args.optim
+    cloned = args.clone()
+    optim.name = 'sgd'
+    
+    assert args.optim.name == 'sgd'
+    assert cloned.optim.name == 'adam'
+
+
+def test_clone_of_clone():
+    args = make_args()
+    cloned = args.clone()
+    cloned.optim.name = 'sgd'
+    cloned2 = cloned.clone()
+    cloned.optim.name = 'rmsprop'
+    cloned2.lr = 1.0
+    
+    assert args.optim.name == 'adam'
+    assert cloned.optim.name == 'rmsprop'
+    assert cloned2.optim.name == 'sgd'
+    assert cloned.lr == 0.1
+    assert cloned2.lr == 1.0
+
+
+def test_ref_counts_are_tracked_separately():
+    args = make_args()
+    cloned = args.clone()
+    for _ in range(5):
+        args.lr
+        args.optim.sched.step
+    
+    assert cloned.todict(True)['lr'] == (0.1, 0)
+    assert cloned.lr == 0.1
+    assert cloned.todict(True)['lr'] == (0.1, 1)
+    assert cloned.todict(True)['optim']['sched']['step'] == (10, 0)
+    assert args.todict(True)['lr'] == (0.1, 5)
+    
+    cloned.optim.sched.step
+    assert args.todict(True)['optim']['sched']['step'] == (10, 5)
+    assert cloned.todict(True)['optim']['sched']['step'] == (10, 1)
+
+
+def test_forwarded_ref_counts():
+    args = make_args()
+    cloned = args.clone(forward_ref_count = True)
+    cloned.lr
+    cloned.optim.sched.step
+    
+    assert args.todict(True)['lr'] == (0.1, 1)
+    assert args.todict(True)['optim']['sched']['step'] == (10, 1)
+    
+    cloned.lr = 0.5 #An assignment is counted as a reference too
+    cloned.lr
+    assert args.todict(True)['lr'] == (0.1, 3)
+    assert args.lr == 0.1
+
+
+def test_reading_does_not_copy():
+    args = AugmentedNameSpace({'k{}'.format(i): i for i in range(1000)})
+    args.activate(True)
+    cloned = args.clone()
+    cloned.k5
+    
+    assert cloned._mem_argument_dict is args._mem_argument_dict
+    
+    args.k5
+    assert cloned._mem_argument_dict is args._mem_argument_dict
+    assert cloned.todict(True)['k5'] == (5, 1)
+    assert args.todict(True)['k5'] == (5, 1)
+
+
+def test_writing_copies_only_the_path():
+    args = AugmentedNameSpace({'a': {'k{}'.format(i): i for i in range(100)}, 'b': {'k{}'.format(i): i for i in range(100)}})
+    cloned = args.clone()
+    cloned.a.k1 = -1
+    
+    assert cloned._mem_argument_dict is args._mem_argument_dict
+    assert cloned.a._mem_argument_dict is not args.a._mem_argument_dict
+    assert cloned.b._mem_argument_dict is args.b._mem_argument_dict
+
+
+def test_trim_on_clone():
+    args = make_args()
+    cloned = args.clone()
+    cloned.lr
+    cloned.optim.name
+    cloned.trim()
+    
+    assert cloned.todict() == {'lr': 0.1, 'optim': {'name': 'adam'}}
+    assert args.todict() == make_args().todict()
+
+
+def test_trim_on_original():
+    args = make_args()
+    cloned = args.clone()
+    args.model
+    args.trim()
+    
+    assert args.todict() == {'model': 'resnet18'}
+    assert cloned.todict() == make_args().todict()
+
+
+def test_copy_returns_clone():
+    args = make_args()
+    copied = copy.copy(args)
+    copied.lr = 1.0
+    assert args.lr == 0.1
+
+
+def test_ref_counts_do_not_leak_into_clone_of_clone():
+    args = AugmentedNameSpace({'n': {'k': 1}, 'v': 0})
+    args.activate(True)
+    cloned = args.clone()
+    cloned.n.k
+    cloned2 = cloned.clone()
+    cloned.n.k
+    cloned.n.k
+    
+    assert cloned2.todict(True)['n']['k'] == (1, 1)
+    assert cloned.todict(True)['n']['k'] == (1, 3)
+    assert cloned2.trim(2) is None
+    assert cloned.trim(2).todict() == {'n': {'k': 1}}
+
+
+def test_reading_original_does_not_fork_clone():
+    args = AugmentedNameSpace({'g{}'.format(i): {'k': i} for i in range(100)})
+    args.activate(True)
+    cloned = args.clone()
+    cloned.g1.k
+    args.g1.k
+    args.g2.k
+    
+    assert all(cloned._mem_children['g{}'.format(i)] is args._mem_children['g{}'.format(i)] for i in range(3, 100))
+    assert cloned.todict(True)['g2'] == {'k': (2, 0)}
+    assert args.todict(True)['g1'] == {'k': (1, 1)}
+
+
+def test_never_cloned_namespace_is_not_tracked():
+    args = make_args()
+    args.optim.sched.step
+    args.optim.sched.step = 20
+    
+    assert args._mem_tree == [False]
+    assert args.optim._mem_exposed is None
+
+
+def test_getitem_on_clone():
+    args = make_args()
+    cloned = args.clone()
+    cloned.optim.name = 'sgd'
+    
+    assert cloned['optim']['name'] == 'sgd'
+    assert args['optim']['name'] == 'adam'
+    assert cloned['lr'] == 0.1
@@ -0,0 +1,52 @@
+import argparse
+
+from dynamicargparse import DynamicArgumentParser
+
+
+def make_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--run_id', type=str)
+    parser.add_argument('--epochs', default=10)
+    parser.add_argument('--gpus', nargs='+', default=[0, 1])
+    parser.add_argument('--layers', type=int, nargs='+', default=3)
+    parser.add_argument('--lr', type=float, default=0.1)
+    return parser
+
+
+def test_declared_str_is_not_inferred():
+    dynamicparser = DynamicArgumentParser(staticparser = make_parser())
+    args = dynamicparser.parse_argument(args = '--run_id 007'.split())
+    assert args.run_id == '007'
+    assert dynamicparser.arg_dict['run_id'] == ('007', 'str')
+
+
+def test_untyped_defaults_keep_their_types():
+    args = DynamicArgumentParser(staticparser = make_parser()).parse_argument(args = [])
+    assert args.epochs == 10
+    assert args.gpus == [0, 1]
+
+
+def test_scalar_default_of_list_argument_is_not_wrapped():
+    args = DynamicArgumentParser(staticparser = make_parser()).parse_argument(args = [])
+    assert args.layers == 3
+    
+    args = DynamicArgumentParser(staticparser = make_parser()).parse_argument(args = '--layers 3 4'.split())
+    assert args.layers == [3, 4]
+
+
+def test_declared_types_apply_to_config_file(tmp_path):
+    cfg = tmp_path / 'cfg.yaml'
+    cfg.write_text('run_id: 7\nlr: 1\nlayers: 5\n')
+    dynamicparser = DynamicArgumentParser(staticparser = make_parser())
+    args = dynamicparser.parse_argument(args = ['--conf', str(cfg)], cfgfile_arg = 'conf')
+    assert args.run_id == '7'
+    assert args.lr == 0.1 #Command-line defaults have a priority
+    assert dynamicparser.arg_dict['lr'][1] == 'float'
+
+
+def test_declared_types_apply_to_dynamic_arguments():
+    dynamicparser = DynamicArgumentParser(staticparser = make_parser())
+    dynamicparser.dynamic_parse_cmd_args('--run_id 1 --layers 2 --epochs 5'.split(), add_mode = 'n')
+    assert dynamicparser.arg_dict['run_id'] == ('1', 'str')
+    assert dynamicparser.arg_dict['layers'] == ([2], 'list_int')
+    assert dynamicparser.arg_dict['epochs'] == ('5', 'str')
@@ -0,0 +1,56 @@
+import json
+import tracemalloc
+
+from dynamicargparse import DynamicArgumentParser, ParseTracer
+
+
+STAGES = ['static', 'dynamic', 'config', 'build_dict', 'namespace']
+
+
+def test_stages_and_counters(tmp_path):
+    cfg = tmp_path / 'cfg.yaml'
+    cfg.write_text('lr: 1\nmodel: resnet18\n')
+    records = []
+    tracer = ParseTracer(callback = records.append)
+    
+    dynamicparser = DynamicArgumentParser(tracer = tracer)
+    dynamicparser.parse_argument(args = ['--conf', str(cfg), '--lr', '0.5'], cfgfile_arg = 'conf')
+    
+    assert [record['stage'] for record in tracer.stages] == STAGES
+    assert records == tracer.stages
+    assert tracer.stages[-1]['num_args'] == 3
+    assert tracer.counters == {'config_bytes': cfg.stat().st_size, 'type_conflicts': 1}
+    assert json.loads(tracer.tojson()) == tracer.todict()
+
+
+def test_tracer_is_reset_for_each_parse():
+    tracer = ParseTracer()
+    dynamicparser = DynamicArgumentParser(tracer = tracer)
+    dynamicparser.parse_argument(args = ['--a', '1'])
+    dynamicparser.parse_argument(args = ['--a', '1'])
+    
+    assert [record['stage'] for record in tracer.stages] == ['static', 'dynamic', 'build_dict', 'namespace']
+
+
+def test_peak_memory():
+    tracer = ParseTracer(trace_memory = True)
+    DynamicArgumentParser(tracer = tracer).parse_argument(args = ['--a', '1'])
+    assert all(record['peak_memory'] >= 0 for record in tracer.stages)
+    assert not tracemalloc.is_tracing()
+
+
+def test_caller_tracing_is_kept():
+    tracemalloc.start()
+    try:
+        data = [bytes(1 << 20)]
+        peak = tracemalloc.get_traced_memory()[1]
+        del data
+        
+        tracer = ParseTracer(trace_memory = True)
+        DynamicArgumentParser(tracer = tracer).parse_argument(args = ['--a', '1'])
+        
+        assert tracemalloc.is_tracing()
+        assert tracemalloc.get_traced_memory()[1] >= peak
+        assert all('peak_memory' not in record for record in tracer.stages)
+    finally:
+        tracemalloc.stop()